@@ -5,6 +5,7 @@ integers. """
 from __future__ import annotations
 from testgen import TestCase, TestCollection
 from dataclasses import dataclass
+import numpy as np
 
 
 MAX_ARRAY_SIZE = int(2e5)
@@ -13,19 +14,18 @@ MAX_ELEMENT = int(1e9)
 
 @dataclass
 class ArraySum(TestCase):
-    input: list[int]
+    input: np.ndarray
 
     def write_input(self, input_f) -> None:
-        print(len(self.input), file=input_f)
-        print(' '.join(str(i) for i in self.input), file=input_f)
+        input_f.write(b'%d\n' % len(self.input))
+        np.savetxt(input_f, self.input[np.newaxis], fmt='%d')
 
-    def write_answer(self, answer_f, input_f) -> None:
-        print(sum(self.input), file=answer_f)
+    def write_answer(self, answer_f) -> None:
+        print(self.input.sum(), file=answer_f)
 
     def validate(self) -> None:
         assert 1 <= len(self.input) <= MAX_ARRAY_SIZE
-        for v in self.input:
-            assert 1 <= v <= MAX_ELEMENT
+        assert 1 <= self.input.min() and self.input.max() <= MAX_ELEMENT
 
 
 tests = TestCollection('data/secret', ArraySum)
@@ -33,7 +33,7 @@ tests = TestCollection('data/secret', ArraySum)
 
 @tests.collect(desc='max sized array filled with ones')
 def all_ones() -> ArraySum:
-    return ArraySum([1] * MAX_ARRAY_SIZE)
+    return ArraySum(np.ones(MAX_ARRAY_SIZE, dtype=np.int64))
 
 
 @tests.collect(
@@ -41,13 +41,15 @@ def all_ones() -> ArraySum:
     params={'length': range(1, 10), 'value': (8743, 12, 999_999)},
 )
 def same_values(length: int, value: int) -> ArraySum:
-    return ArraySum([value] * length)
+    return ArraySum(np.full(length, value, dtype=np.int64))
 
 
 @tests.collect(desc='random max sized array', repeat=3)
-def random_list(random) -> ArraySum:
+def random_list(np_random) -> ArraySum:
     return ArraySum(
-        [random.randint(1, MAX_ELEMENT) for _ in range(MAX_ARRAY_SIZE)]
+        np_random.integers(
+            1, MAX_ELEMENT + 1, size=MAX_ARRAY_SIZE, dtype=np.int64,
+        )
     )
 
 
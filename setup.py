@@ -18,5 +18,10 @@ setup(
     long_description_content_type='text/markdown',
     url='https://github.com/RealA10N/testgen',
     py_modules=['testgen'],
+    python_requires='>=3.9',
     install_requires=DEPENDENCIES,
+    extras_require={
+        'numpy': ['numpy>=1.17'],
+        'numba': ['numpy>=1.17', 'numba'],
+    },
 )
@@ -1,28 +1,90 @@
 from __future__ import annotations
 
 import os
-from math import floor, log10
+import subprocess
+import sys
+from array import array
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait,
+)
+from math import prod
 from abc import abstractmethod, ABC
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, field
+from functools import lru_cache
 from random import Random
-from typing import Callable, Iterable, TextIO, Type, TypeVar
+from typing import (
+    Any, BinaryIO, Callable, Iterable, Iterator, Mapping, TextIO, Type,
+    TypeVar,
+)
 import platform
-import shutil
 import inspect
+import hashlib
 import itertools
+import multiprocessing
 
 import toml
 
 from rich.console import Console
+from rich.markup import escape
 from rich.prompt import Confirm
 console = Console()
 
 SEED_RANGE = (1, 1_000_000)
 DEFAULT_TESTS_CONFIG = 'testgen.toml'
+WRITE_BUFFER_SIZE = 1 << 20
+TEST_FILE_EXTENSIONS = ('.in', '.ans', '.desc')
 
 T = TypeVar('T')
 
-__all__ = ['TestCollection', 'TestCase']
+__all__ = ['TestCollection', 'TestCase', 'bulk_randint', 'njit_validator']
+
+
+@lru_cache(maxsize=None)
+def _params_of(func: Callable) -> Mapping[str, inspect.Parameter]:
+    """ Returns the parameters of the given function. Inspecting a signature
+    is relatively expensive, and the same builders are inspected once for
+    every generated test case, hence the cache. """
+    return inspect.signature(func).parameters
+
+
+def bulk_randint(rnd: Random, a: int, b: int, n: int) -> list[int]:
+    """ Returns a list of `n` random integers in the range [a, b], drawn from
+    the given random generator. Much faster than calling `rnd.randint` `n`
+    times, since all of the random bits are drawn using a single call. Each
+    64 bits are mapped into the range using a multiplication and a shift, so
+    the range can contain at most 2^32 integers (which keeps the bias of the
+    mapping below 2^-32). """
+
+    span = b - a + 1
+    if not 0 < span <= 1 << 32:
+        raise ValueError(f'invalid range for bulk_randint ({a}, {b})')
+
+    draws = array('Q', rnd.randbytes(8 * n))
+    if sys.byteorder == 'big':
+        # Keep the generated integers identical across platforms.
+        draws.byteswap()
+    return [a + (x * span >> 64) for x in draws]
+
+
+def njit_validator(func: Callable[..., T]) -> Callable[..., T]:
+    """ A decorator that compiles the given validation function using Numba,
+    if it is installed. Otherwise, the function is returned unchanged.
+    Compiled validators should receive the test case data as NumPy arrays
+    (and scalars), and can loop over them element by element at native
+    speed. For example:
+
+        @njit_validator
+        def check_range(values: np.ndarray, low: int, high: int) -> None:
+            for v in values:
+                assert low <= v <= high
+
+    And then call `check_range(self.input, 1, MAX_ELEMENT)` in `validate`. """
+
+    try:
+        import numba
+    except ImportError:
+        return func
+    return numba.njit(cache=True)(func)
 
 
 @dataclass
@@ -30,12 +92,19 @@ class TestsConfig:
     name: str
     seed: int
     check: int
+    _stored: dict = field(default=None, init=False, repr=False, compare=False)
 
     def dump(self) -> None:
-        data = asdict(self)
-        del data['name']
+        """ Writes the configuration into its file, unless the file is already
+        known to contain the exact same data. """
+
+        data = {'seed': self.seed, 'check': self.check}
+        if data == self._stored:
+            return
+
         with open(self.name, 'w', encoding='utf8') as f:
             toml.dump(data, f)
+        self._stored = data
 
     @classmethod
     def generate_config(cls: Type[T], name: str) -> T:
@@ -55,11 +124,22 @@ class TestsConfig:
         seed. """
 
         data = toml.load(name)
-        return cls(name=name, **data)
+        cfg = cls(name=name, **data)
+        cfg._stored = data
+        return cfg
 
     def get_random(self) -> Random:
         return Random(self.seed)
 
+    def get_case_seed(self, index: int) -> int:
+        """ Returns the seed of the test case in the given (zero based)
+        position of the collection. The seed depends only on the configuration
+        seed and the position, so any single test case can be generated again
+        without generating the cases that precede it. """
+
+        digest = hashlib.sha256(f'{self.seed}:{index}'.encode()).digest()
+        return int.from_bytes(digest[:8], 'little')
+
     def check_seed(self) -> bool:
         return self.get_random().randint(*SEED_RANGE) == self.check
 
@@ -67,14 +147,33 @@ class TestsConfig:
 class TestCase(ABC):
 
     @abstractmethod
-    def write_input(self, input_f: TextIO) -> None:
-        """ Receives an open file for writing, and writes the test case input
-        data into the file. """
+    def write_input(self, input_f: BinaryIO) -> None:
+        """ Receives an open binary file for writing, and writes the test case
+        input data into the file as bytes. """
 
-    def write_answer(self, answer_f: TextIO, input_f: TextIO) -> None:
+    def write_answer(
+        self,
+        answer_f: TextIO,
+        input_f: TextIO = None,
+        input_data: bytes = None,
+    ) -> None:
         """ Receives an open file for writing, and writes the test case answer
-        data into the file. Also has read access to the input file, to use with
-        subprocess's run function to execute judges solution. """
+        data into the file. If the overriding function accepts an `input_f`
+        parameter, it also has read access to the input file, to use with
+        subprocess's run function to execute judges solution. If it accepts an
+        `input_data` parameter, it receives the written input as bytes, which
+        can be piped to the judges solution using `run_judge`. Otherwise, the
+        input is not kept in memory and the input file is not reopened. """
+
+    @staticmethod
+    def run_judge(cmd: list[str], input_data: bytes) -> bytes:
+        """ Runs the given command (usually the judges solution) with the
+        given input piped into its standard input, and returns its standard
+        output. Raises `subprocess.CalledProcessError` if it fails. """
+
+        return subprocess.run(
+            cmd, input=input_data, stdout=subprocess.PIPE, check=True,
+        ).stdout
 
     def validate(self) -> None:
         """ Called on a test case after generating it but before storing it into
@@ -90,10 +189,25 @@ TestCaseBuilder = Callable[[], TestCaseT]
 @dataclass
 class CollectedTestCase:
     builder: TestCaseBuilder
-    params: dict[str, Iterable]
+    params: dict[str, tuple]
+    repeat: int = 1
     name: str = None
     desc: str = None
 
+    def __len__(self) -> int:
+        """ The number of test cases that will be generated from the
+        collected builder: the size of the parameter product, repeated. """
+        return prod(len(values) for values in self.params.values()) * self.repeat
+
+    def iter_params(self) -> Iterator[dict[str, Any]]:
+        """ Lazily yields the parameters of each test case generated from
+        the collected builder, without materializing the whole product. """
+
+        keys = self.params.keys()
+        for _ in range(self.repeat):
+            for values in itertools.product(*self.params.values()):
+                yield dict(zip(keys, values))
+
 
 class TestCollection:
 
@@ -117,6 +231,12 @@ class TestCollection:
         name. Uses prompts to talk with the user if the configuration file
         is corrupted or if the check doesn't match the seed. """
 
+        if multiprocessing.current_process().name != 'MainProcess':
+            # The generation script is imported again by worker processes
+            # that use the spawn start method. The configuration was already
+            # set up by the main process, so load it without any prompts.
+            return TestsConfig.load(cfgname)
+
         console.rule('Environemt')
         console.print(
             'running on [yellow bold]'
@@ -160,90 +280,225 @@ class TestCollection:
         if params is None:
             params = dict()
 
-        params = [
-            dict(zip(params.keys(), p))
-            for p in itertools.product(*params.values())
-        ] * repeat
+        params = {key: tuple(values) for key, values in params.items()}
 
         def decorator(builder: TestCaseBuilder):
-            for p in params:
-                self.builders.append(
-                    CollectedTestCase(
-                        builder=builder,
-                        name=builder.__name__.replace('_', '-'),
-                        desc=desc,
-                        params=p,
-                    )
+            self.builders.append(
+                CollectedTestCase(
+                    builder=builder,
+                    name=builder.__name__.replace('_', '-'),
+                    desc=desc,
+                    params=params,
+                    repeat=repeat,
                 )
+            )
             return builder
 
         return decorator
 
     @staticmethod
-    def _generate_testcase_data(func: TestCaseBuilder, rnd: Random, params: dict) -> TestCaseT:
-        sig = inspect.signature(func)
-        if 'random' in sig.parameters:
-            params['random'] = rnd
+    def _generate_testcase_data(
+        func: TestCaseBuilder,
+        seed: int,
+        params: dict,
+    ) -> TestCaseT:
+        func_params = _params_of(func)
+        params = dict(params)
+        if 'random' in func_params:
+            params['random'] = Random(seed)
+        if 'np_random' in func_params:
+            import numpy
+            params['np_random'] = numpy.random.default_rng(seed)
         data = func(**params)
         data.validate()
         return data
 
+    @staticmethod
     def _build(
-        self,
+        path_prefix: str,
         builder: TestCaseBuilder,
         name: str,
-        rnd: Random,
+        seed: int,
         params: dict[str, Iterable],
         desc: str = None,
-    ) -> None:
-        console.log(f'[bold yellow]generating test case {name!r}[/]')
-        test = self._generate_testcase_data(builder, rnd, params)
-        console.log('generated test case data')
+    ) -> str:
+        """ Generates a single test case and writes its files. May be called
+        in a worker process, hence it does not print to the console directly,
+        and returns a message that should be logged instead. If the generation
+        fails, raises an error that names the failed test case. """
 
-        in_path = os.path.join(self.folder, f'{name}.in')
-        with open(in_path, 'w', encoding='utf8') as input_f:
-            test.write_input(input_f)
-        console.log(f'generated {in_path!r}')
+        try:
+            written = TestCollection._write_testcase(
+                path_prefix, builder, name, seed, params, desc,
+            )
+        except Exception as exc:
+            raise RuntimeError(f'failed to generate test case {name!r}') from exc
+
+        return (
+            f'[bold yellow]generated test case {name!r}[/] '
+            f'({", ".join(written)})'
+        )
 
-        ans_path = os.path.join(self.folder, f'{name}.ans')
-        with open(in_path, 'r', encoding='utf8') as input_f:
-            with open(ans_path, 'w', encoding='utf8') as answer_f:
-                test.write_answer(answer_f, input_f)
-        console.log(f'generated {ans_path!r}')
+    @staticmethod
+    def _write_testcase(
+        path_prefix: str,
+        builder: TestCaseBuilder,
+        name: str,
+        seed: int,
+        params: dict[str, Iterable],
+        desc: str = None,
+    ) -> list[str]:
+        """ Generates a single test case, writes its files and returns the
+        extensions of the written files. """
+
+        test = TestCollection._generate_testcase_data(builder, seed, params)
+
+        # The input is kept in memory or reopened only for overriding
+        # functions that explicitly ask for it.
+        write_answer = type(test).write_answer
+        answer_params = dict()
+        if write_answer is not TestCase.write_answer:
+            answer_params = _params_of(write_answer)
+        answer_kwargs = dict()
+
+        in_path = path_prefix + name + '.in'
+        keep_input = 'input_data' in answer_params
+        mode = 'w+b' if keep_input else 'wb'
+        with open(in_path, mode, buffering=WRITE_BUFFER_SIZE) as input_f:
+            test.write_input(input_f)
+            if keep_input:
+                # Read the written input back using the same file handle.
+                # Seeking flushes the write buffer, and reading issues actual
+                # read calls. The input is not captured while it is written,
+                # since writers such as ndarray.tofile write directly to the
+                # file descriptor, bypassing any Python level wrapper.
+                input_f.seek(0)
+                answer_kwargs['input_data'] = input_f.read()
+        written = ['.in']
+
+        ans_path = path_prefix + name + '.ans'
+        with open(ans_path, 'w', encoding='utf8', buffering=WRITE_BUFFER_SIZE) as answer_f:
+            if 'input_f' in answer_params:
+                with open(in_path, 'r', encoding='utf8') as input_f:
+                    test.write_answer(answer_f, input_f=input_f, **answer_kwargs)
+            else:
+                test.write_answer(answer_f, **answer_kwargs)
+        written.append('.ans')
 
         if desc:
-            desc_path = os.path.join(self.folder, f'{name}.desc')
-            with open(desc_path, 'w', encoding='utf8') as f:
+            desc_path = path_prefix + name + '.desc'
+            with open(desc_path, 'w', encoding='utf8', buffering=WRITE_BUFFER_SIZE) as f:
                 print(desc, file=f)
-            console.log(f'generated {desc_path!r}')
+            written.append('.desc')
+
+        return written
+
+    @classmethod
+    def _run_builds(cls, jobs: Iterable[dict], workers: int) -> Iterator[str]:
+        """ Builds the given test cases and yields the log of each one as it
+        completes. If more than a single worker is requested, the test cases
+        are built in parallel using a pool of processes. Jobs are consumed
+        lazily, and only a bounded number of them is submitted at a time. """
+
+        if workers == 1:
+            for job in jobs:
+                yield cls._build(**job)
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            try:
+                for job in jobs:
+                    if len(pending) >= 2 * workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
+                    pending.add(executor.submit(cls._build, **job))
+
+                for future in as_completed(pending):
+                    yield future.result()
+
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+    def _iter_jobs(self, first_test_i: int, width: int) -> Iterator[dict]:
+        """ Lazily yields the arguments of the build of each collected test
+        case, in the order of collection. """
+
+        cases = (
+            (case, params)
+            for case in self.builders
+            for params in case.iter_params()
+        )
+
+        path_prefix = os.path.join(self.folder, '')
+        for index, (case, params) in enumerate(cases):
+            istr = str(first_test_i + index).zfill(width)
+            name = istr if case.name is None else f'{istr}-{case.name}'
+            yield dict(
+                path_prefix=path_prefix,
+                builder=case.builder,
+                name=name,
+                desc=case.desc,
+                seed=self.config.get_case_seed(index),
+                params=params,
+            )
+
+    def generate(
+        self,
+        first_test_i: int = 1,
+        workers: int = 1,
+        quiet: bool = False,
+    ) -> None:
+        """ Generates all collected test cases into the tests folder. By
+        default, test cases are built one by one in the current process. If
+        `workers` is greater than one, they are built in parallel by a pool of
+        that many processes (`None` uses one process per CPU). In that case,
+        the collected builders (and their parameters) must be picklable, which
+        means they have to be defined at the top level of the generation
+        script (no lambdas or closures), and the script must guard the call to
+        `generate` with `if __name__ == '__main__'`. If `quiet` is set,
+        generated test cases are not logged, and only the progress status is
+        shown. """
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError(f'workers must be a positive integer, got {workers}')
 
-    def generate(self, first_test_i: int = 1) -> None:
         console.rule('Generation')
 
         os.makedirs(self.folder, exist_ok=True)
-        if os.path.isdir(self.folder) and os.listdir(self.folder):
-            console.print(f'{self.folder!r} is not empty.')
-            if not Confirm.ask('Clear directory and continue?', console=console):
+        with os.scandir(self.folder) as entries:
+            stale = [
+                entry.path for entry in entries
+                if entry.is_file() and entry.name.endswith(TEST_FILE_EXTENSIONS)
+            ]
+
+        if stale:
+            console.print(f'{self.folder!r} contains existing test files.')
+            if not Confirm.ask('Remove them and continue?', console=console):
                 raise SystemExit(1)
-            shutil.rmtree(self.folder)
-            os.makedirs(self.folder, exist_ok=True)
-
-        assert len(self.builders) > 0
-        max_i = first_test_i + len(self.builders) - 1
-        leading_zeros = floor(log10(max_i)) + 1
-
-        rnd = self.config.get_random()
-        with console.status('Generating Test Cases'):
-            for case, i in zip(
-                    self.builders,
-                    range(first_test_i, first_test_i + len(self.builders))
-            ):
-                istr = format(i, f'0{leading_zeros}d')
-                name = istr if case.name is None else f'{istr}-{case.name}'
-                self._build(
-                    builder=case.builder,
-                    name=name,
-                    desc=case.desc,
-                    rnd=rnd,
-                    params=case.params,
-                )
+            for path in stale:
+                os.unlink(path)
+
+        total = sum(len(case) for case in self.builders)
+        assert total > 0
+        max_i = first_test_i + total - 1
+        width = len(str(max_i))
+
+        jobs = self._iter_jobs(first_test_i, width)
+
+        with console.status('Generating Test Cases') as status:
+            try:
+                for done, log in enumerate(self._run_builds(jobs, workers), start=1):
+                    if not quiet:
+                        console.log(log)
+                    status.update(f'Generating Test Cases ({done}/{total})')
+            except RuntimeError as exc:
+                # Failures are logged even in quiet mode, so the failed test
+                # case is visible among the logs of the generated ones.
+                console.log(f'[bold red]{escape(str(exc))}[/]')
+                raise